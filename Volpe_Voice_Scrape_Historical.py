@@ -17,10 +17,20 @@
 #Input information is:
 #   -Login information [config.txt]
 #
+#Options are:
+#   -Profile each stage of the page scan, and capture slow pages [--profile]
+#   -Re-extract links from the token cache, without connecting to the server [--offline]
+#   -Check that every linked dashboard page still exists, skipped with --offline [--verify]
+#
 #Output files are:
 #   -Article links to be placed on the dashboards [volpe_voice_dash_links_YYYYMMDD.txt]
 #   -Errors file, to be corrected [volpe_voice_errors.xlsx]
 #   -Backed up versions of the old link and error files [\Old Link Files, \Old Error Logs]
+#   -Profile of the page scan, when profiling [volpe_voice_profile_historical_YYYYMMDD_HHMMSS.txt, .prof]
+#   -Raw HTML and stage timings of slow pages, when profiling [\Slow Page Captures]
+#   -Titles, dates, sentences, concordance words and dashboard links of each page, keyed by a hash of the post title, date and body [\Token Cache\volpe_voice_tokens_ID.bin]
+#   -Results of recent dashboard link checks, when verifying [volpe_voice_link_cache.txt]
+#   -Project and staff links whose name was not found on the dashboard page, to be confirmed by hand [volpe_voice_link_warnings_historical.xlsx]
 #
 #Script produced by:
 #   -Alex Linthicum, USDOT Volpe Center
@@ -31,16 +41,24 @@
 
 
 ###Libraries
+import cProfile
+import hashlib
 import math
+import mmap
 import os
 import pandas as pd
+import pstats
 import re
 import requests
 import shutil
+import struct
 import sys
+import threading
 import time
 import unidecode
+import urllib.parse
 from bs4 import BeautifulSoup
+from concurrent.futures import ThreadPoolExecutor
 from nltk.tokenize import sent_tokenize
 from nltk.tokenize import word_tokenize
 from requests_ntlm import HttpNtlmAuth
@@ -129,6 +147,216 @@ def cleanCategory(category):
         return 'UNK'
 
 
+###Starts timing a stage of the page scan, and profiles it if profiling is on
+def stageStart(stage,profiles):
+    if stage in profiles: #If this stage is being profiled
+        profiles[stage].enable() #Start collecting profile data for the stage
+    return time.perf_counter() #Time the stage started
+
+
+###Stops timing a stage of the page scan, and adds the elapsed time to the page timings
+def stageStop(stage,profiles,stageTimes,startTime):
+    if stage in profiles: #If this stage is being profiled
+        profiles[stage].disable() #Stop collecting profile data for the stage
+    stageTimes[stage] = stageTimes.get(stage,0) + time.perf_counter() - startTime #Stages run once per link are summed over the page
+
+
+###Writes the raw HTML and stage timings of a slow page, for offline replay
+def captureSlowPage(num,html,stageTimes):
+    captureDir = os.path.join(sys.path[0],'Slow Page Captures') #Folder holding the slow page captures
+    os.makedirs(captureDir,exist_ok=True) #Create the folder, if it doesn't exist yet
+    if html is not None: #If the page was retrieved from the server, rather than the token cache
+        htmlFile = open(os.path.join(captureDir,'volpe_voice_page_' + str(num) + '.html'),'w',encoding='utf8') #Raw HTML of the page
+        htmlFile.write(html) #Write the page exactly as it was retrieved
+        htmlFile.close() #Close the HTML file
+    timeFile = open(os.path.join(captureDir,'volpe_voice_page_' + str(num) + '_timings.txt'),'w') #Stage timings of the page
+    for stage in stageTimes: #For each stage the page went through
+        timeFile.write(stage + '|' + '%.4f' % stageTimes[stage] + '\n') #Write the stage name and seconds spent
+    timeFile.write('total|' + '%.4f' % sum(stageTimes.values()) + '\n') #Write the total seconds spent on the page
+    timeFile.close() #Close the timings file
+
+
+###Writes the aggregated profile of the page scan, both as a report and as raw stats
+def writeProfile(profiles,runTimes,pageTimes):
+    profileName = 'volpe_voice_profile_historical_' + time.strftime('%Y%m%d_%H%M%S') #Name of the profile files, without extension
+    stageProfiles = {} #Profiles of the stages that actually ran
+    for stage in profiles: #For each profiled stage
+        profiles[stage].create_stats() #Snapshot the profile data
+        if profiles[stage].stats: #If the stage ran at least once
+            stageProfiles[stage] = profiles[stage] #Include it in the output
+    if not stageProfiles: #If no stage ran, there is nothing to write
+        return
+    reportFile = open(profileName + '.txt','w') #Human readable profile report
+    reportFile.write('Seconds per stage:\n') #Time spent in each stage over the whole run
+    for stage in runTimes: #For each stage that ran
+        reportFile.write('    ' + stage + '|' + '%.4f' % runTimes[stage] + '\n') #Write the stage name and seconds spent
+    reportFile.write('\nSlowest pages:\n') #Pages that took the longest to process
+    for pageTime in sorted(pageTimes,reverse=True)[:10]: #For the ten slowest pages
+        reportFile.write('    ' + str(pageTime[1]) + '|' + '%.4f' % pageTime[0] + '\n') #Write the page number and seconds spent
+    for stage in stageProfiles: #For each stage that ran
+        reportFile.write('\n\n###Stage: ' + stage + '\n') #Label the stage
+        pstats.Stats(stageProfiles[stage],stream=reportFile).sort_stats('cumulative').print_stats(20) #Top functions of the stage
+    reportFile.close() #Close the profile report
+    pstats.Stats(*stageProfiles.values()).dump_stats(profileName + '.prof') #All stages combined, for use in other profiling tools
+
+
+###Token cache file header
+cacheMagic = b'VVTC' #Marks a file as a token cache file
+cacheVersion = 2 #Increase whenever the page cleanup changes, so old cache files are ignored
+
+
+###Packs a list of strings as a count, followed by the length and UTF-8 bytes of each string
+def packStrings(strings):
+    packed = [struct.pack('<I',len(strings))] #Number of strings
+    for string in strings: #For each string in the list
+        encoded = string.encode('utf8') #String as bytes
+        packed.append(struct.pack('<I',len(encoded)) + encoded) #Length of the string, then the string itself
+    return b''.join(packed)
+
+
+###Unpacks a list of strings written by packStrings, returning the strings and the offset after them
+def unpackStrings(buf,offset):
+    count = struct.unpack_from('<I',buf,offset)[0] #Number of strings
+    offset += 4 #Move past the count
+    strings = [] #Strings read so far
+    for x in range(count): #For each string in the list
+        length = struct.unpack_from('<I',buf,offset)[0] #Length of the string in bytes
+        if offset+4+length > len(buf): #If the string runs past the end of the data
+            raise ValueError('String runs past the end of the data') #The data was cut short
+        strings.append(buf[offset+4:offset+4+length].decode('utf8')) #Read the string itself
+        offset += 4 + length #Move past the string
+    return [strings,offset]
+
+
+###Returns the token cache file name for a page
+def cacheFileName(num):
+    return os.path.join(sys.path[0],'Token Cache','volpe_voice_tokens_' + str(num) + '.bin')
+
+
+###Writes the title, date, sentences, concordance words and dashboard links of a page to the token cache
+def writeCache(num,pageHash,bpTitle,bpDate,pageSent,pageTokens,pageAnchors):
+    os.makedirs(os.path.join(sys.path[0],'Token Cache'),exist_ok=True) #Create the cache folder, if it doesn't exist yet
+    windows = sorted(pageTokens) #Runs of sentences that have been tokenized, as [first, last]
+    windowInfo = [number for window in windows for number in [window[0],window[1],len(pageTokens[window])]] #First sentence, last sentence and number of words of each run
+    cacheFile = open(cacheFileName(num) + '.tmp','wb') #Temporary cache file for this page, so an interrupted write leaves no partial file
+    cacheFile.write(cacheMagic + struct.pack('<II',cacheVersion,num) + pageHash) #Header, identifying the page and its content
+    cacheFile.write(packStrings([bpTitle,bpDate])) #Article title and post date
+    cacheFile.write(packStrings(pageSent)) #Sentences of the article
+    cacheFile.write(struct.pack('<I%dI' % len(windowInfo),len(windows),*windowInfo)) #Sentences and number of words of each run
+    cacheFile.write(packStrings([token for window in windows for token in pageTokens[window]])) #Words of all runs, back to back
+    cacheFile.write(packStrings([text for anchor in pageAnchors for text in anchor])) #Address and text of each dashboard link, back to back
+    cacheFile.close() #Close the cache file
+    os.replace(cacheFileName(num) + '.tmp',cacheFileName(num)) #Move the completed file into place
+
+
+###Reads a page from the token cache, if it is there and matches the post content [pageHash of None skips the content check]
+def readCache(num,pageHash):
+    if not os.path.isfile(cacheFileName(num)): #If the page has never been cached
+        return None
+    cacheFile = open(cacheFileName(num),'rb') #Cache file for this page
+    try: #Release the file, however the read ends
+        buf = mmap.mmap(cacheFile.fileno(),0,access=mmap.ACCESS_READ) #Map the file, rather than reading it all in
+        try: #Unmap the file, however the read ends
+            magic,version,cacheNum = struct.unpack_from('<4sII',buf,0) #Header, identifying the page
+            if magic != cacheMagic or version != cacheVersion or cacheNum != num: #If the file is not a current cache of this page
+                return None
+            if pageHash is not None and buf[12:44] != pageHash: #If the page has changed since it was cached
+                return None
+            info,offset = unpackStrings(buf,44) #Article title and post date
+            pageSent,offset = unpackStrings(buf,offset) #Sentences of the article
+            windowLen = struct.unpack_from('<I',buf,offset)[0] #Number of runs of sentences that have been tokenized
+            windowInfo = struct.unpack_from('<%dI' % (3*windowLen),buf,offset+4) #First sentence, last sentence and number of words of each run
+            tokens,offset = unpackStrings(buf,offset+4+12*windowLen) #Words of all runs, back to back
+            anchors,offset = unpackStrings(buf,offset) #Address and text of each dashboard link, back to back
+            pageHash = bytes(buf[12:44]) #Hash of the post content the file was made from
+        finally:
+            buf.close() #Unmap the file
+    except (struct.error,ValueError,UnicodeDecodeError): #If the file is empty, truncated or otherwise damaged
+        return None #Treat the page as not cached
+    finally:
+        cacheFile.close() #Close the cache file
+    pageTokens = {} #Words of each run of sentences, as [first, last] = words
+    start = 0 #Position of the first word of the current run
+    for x in range(0,len(windowInfo),3): #For each run of sentences
+        pageTokens[(windowInfo[x],windowInfo[x+1])] = tokens[start:start+windowInfo[x+2]] #Words of the run
+        start += windowInfo[x+2] #Move to the next run
+    pageAnchors = [anchors[x:x+2] for x in range(0,len(anchors),2)] #Pair up each link address with its text
+    return [info[0],info[1],pageHash,pageSent,pageTokens,pageAnchors]
+
+
+###Returns the words of the sentences from first to last, only tokenizing them if they are not already cached
+def windowTokens(pageSent,pageTokens,first,last):
+    if (first,last) not in pageTokens: #If this run of sentences hasn't been tokenized yet
+        pageTokens[(first,last)] = word_tokenize(' '.join(pageSent[first:last+1])) #Tokenize the joined sentences, as sentence breaks can change the words
+    return pageTokens[(first,last)]
+
+
+###Per-thread web sessions for checking dashboard links
+linkSessions = threading.local()
+
+
+###Checks whether a dashboard link leads to a page that exists ['Missing' if the page loads without the project or staff name, None if the check could not be made]
+def isLiveLink(href,username,password,linkTimeout):
+    try: #If the server can be reached
+        if not hasattr(linkSessions,'session'): #If this thread has no session yet
+            linkSessions.session = requests.Session() #Create webserver session for this thread
+            linkSessions.session.auth = HttpNtlmAuth(username,password) #Authenticate
+        r = linkSessions.session.get(href,timeout=linkTimeout) #Retrieve page, using this thread's session, giving up on a server that stops responding
+        if r.status_code >= 400 or 'SharePointError' in r.headers: #If the server reports the page doesn't exist
+            return False
+        category = href.split('DW/Pages/')[-1].split('.')[0].lower() #Dashboard page the link leads to
+        if category in ['project-all','projectmaster-all','staff'] and '=' in href: #If the page looks up a project or staff member
+            target = ' '.join(urllib.parse.unquote(href.split('=')[-1]).split()).lower() #Project or staff name the link is for
+            soup = BeautifulSoup(r.text, "html.parser") #Parse the page text using BeautifulSoup
+            for tag in soup(['head','script','style']): #Parts of the page that can repeat the address without showing any results
+                tag.decompose() #Remove them from the page
+            pageText = ' '.join(soup.get_text(' ').split()).lower() #Visible text of the page, with whitespace condensed
+            if target not in pageText: #These pages load for any name, so a closed project or departed staff member may only show as the name missing from the results
+                return 'Missing' #Not confirmed against closed pages, so kept apart from links known to be dead
+        return True
+    except Exception: #If the link is malformed, the server can't be reached, authentication fails or the page can't be read
+        return None
+
+
+###Reads the results of recent dashboard link checks, as [href] = [exists, time checked]
+def readLinkCache():
+    linkCache = {} #Results of previous link checks
+    cacheName = os.path.join(sys.path[0],'volpe_voice_link_cache.txt') #Link check cache file
+    if os.path.isfile(cacheName): #If links have been checked before
+        cacheFile = open(cacheName,'r',encoding='utf8') #Open link check cache file
+        for line in cacheFile.readlines(): #Each previously checked link
+            try: #If the line is a complete entry
+                href,alive,checked = line.strip().rsplit('|',2) #Link, whether it existed, and when it was checked
+                linkCache[href] = [alive == '1',float(checked)] #Store the result
+            except ValueError: #If the line is blank or damaged
+                continue #Skip it, the link will be checked again
+        cacheFile.close() #Close link check cache file
+    return linkCache
+
+
+###Writes the results of recent dashboard link checks, for use by later runs
+def writeLinkCache(linkCache,linkTTL):
+    cacheFile = open(os.path.join(sys.path[0],'volpe_voice_link_cache.txt'),'w',encoding='utf8') #Open link check cache file
+    for href in linkCache: #Each checked link
+        if time.time() - linkCache[href][1] > linkTTL: #If the result is too old to be used again
+            continue #Drop it from the file
+        cacheFile.write(href + '|' + ('1' if linkCache[href][0] else '0') + '|' + str(int(linkCache[href][1])) + '\n') #Link, whether it existed, and when it was checked
+    cacheFile.close() #Close link check cache file
+
+
+###Lists the pages held in the token cache, at or after the starting page
+def cachedPages(startPage):
+    cacheDir = os.path.join(sys.path[0],'Token Cache') #Folder holding the token cache
+    pages = [] #Page numbers found in the cache
+    if os.path.isdir(cacheDir): #If anything has been cached yet
+        for file in os.listdir(cacheDir): #Each file in the cache folder
+            if file.startswith('volpe_voice_tokens_') and file.endswith('.bin'): #If this is a page cache file
+                num = file[len('volpe_voice_tokens_'):-len('.bin')] #Extract the page number
+                if num.isdigit() and int(num) >= startPage: #If the name is a page number [skipping stray copies], in the range being scanned
+                    pages.append(int(num)) #Add the page to the list
+    return sorted(pages)
+
+
 
 if __name__ == '__main__':
     
@@ -146,16 +374,20 @@ if __name__ == '__main__':
     startPage = 1 #Start at the beginning
     endPage = startPage + 25 #Set end page 25 pages ahead of starting page
     print('Starting at page: '+str(startPage)) #Alert the user of starting place
-    volpePostIDs = [] #Array to hold numbers of all pages that exist
-    x = startPage #Start one ahead of the most recent article
-    while x <= endPage: #Until there are 50 pages in a row that don't exist
-        url_str = 'http://spmain.volpe.dot.gov/InternalNews/lists/posts/VolpePost.aspx?ID=' + str(x) #Create link to check
-        r = s.head(url_str) #Retreieve page, using persisting session
-        if r.status_code < 400 and 'SharePointError' not in r.headers: #If the page exists
-            print(x) #Log the page number for the user
-            volpePostIDs.append(x) #Add the page to the list
-            endPage = x + 25 #Always checking 25 pages after the last found article
-        x+= 1 #Advance to next page
+    offline = '--offline' in sys.argv[1:] #Was re-extraction from the token cache requested on the command line?
+    if offline: #If the pages should come from the token cache
+        volpePostIDs = cachedPages(startPage) #All cached pages from the starting place on
+    else: #If the pages should come from the server
+        volpePostIDs = [] #Array to hold numbers of all pages that exist
+        x = startPage #Start one ahead of the most recent article
+        while x <= endPage: #Until there are 50 pages in a row that don't exist
+            url_str = 'http://spmain.volpe.dot.gov/InternalNews/lists/posts/VolpePost.aspx?ID=' + str(x) #Create link to check
+            r = s.head(url_str) #Retreieve page, using persisting session
+            if r.status_code < 400 and 'SharePointError' not in r.headers: #If the page exists
+                print(x) #Log the page number for the user
+                volpePostIDs.append(x) #Add the page to the list
+                endPage = x + 25 #Always checking 25 pages after the last found article
+            x+= 1 #Advance to next page
     print('Completed identification of ' + str(len(volpePostIDs)) + ' pages') #Alert user of total number of articles found
     
     
@@ -170,6 +402,25 @@ if __name__ == '__main__':
     concMin = 25 #Minimum words in a concordance
     concMax = 30 #Maximum words in a concordance
     str_print = '' #String to be written to output file at the end of link collection
+    verifying = '--verify' in sys.argv[1:] and not offline #Was dashboard link checking requested on the command line, and is the server being contacted?
+    if offline and '--verify' in sys.argv[1:]: #If link checking was requested, but the server is not being contacted
+        print('Skipping --verify, as --offline does not connect to the server') #Alert the user the links will not be checked
+    linkWarnings = [] #Running list of links that may be dead, to be confirmed manually
+    linkPages = {} #Pages each dashboard link appears on, as [href] = [[page number, page link], ...]
+    linkTTL = 7*24*60*60 #Seconds before a checked link is checked again
+    linkWorkers = 8 #Most links checked at the same time
+    linkTimeout = 30 #Seconds to wait on the server before a link check is given up, and retried next run
+    
+    
+    ###Setup for profiling
+    profiling = '--profile' in sys.argv[1:] #Was profiling requested on the command line?
+    profiles = {} #Profile of each stage of the page scan, if profiling
+    if profiling: #If profiling was requested
+        for stage in ['fetch','cache','parse','sentences','category','searchTerm','concordance']: #Each stage of the page scan
+            profiles[stage] = cProfile.Profile() #Profile data collected over the whole run
+    slowPage = 5 #Seconds a page can take before it is captured, if profiling
+    runTimes = {} #Seconds spent in each stage over the whole run
+    pageTimes = [] #Seconds spent on each page, along with the page number
     
     
     ###Scan pages for links
@@ -179,37 +430,72 @@ if __name__ == '__main__':
         ###General page information
         print('Page ' + str(num) +'...') #Log article number for the user
         url_str = 'http://spmain.volpe.dot.gov/InternalNews/lists/posts/VolpePost.aspx?ID=' + str(num) #Link to page
-        r = s.get(url_str) #Get page content, using persisting session
-        soup = BeautifulSoup(r.text, "html.parser") #Parse the page text using BeautifulSoup
-        bpTitle = unidecode.unidecode(soup.find_all('h3', class_="blogPostTitle")[0].string).strip() #Article title
-        bpDate = unidecode.unidecode(soup.find_all('h4', class_="blogPostDate")[0].string).strip() #Post data
-        
-        
-        ###Clean up the page text
-        pageSent = [] #List of sentences in the article
-        for td in soup.find_all('td', class_='ms-vb blogPost'): #Page content table cell
-            for string in td.stripped_strings: #Each string within the table cell, with whitespace removed
-                string = unidecode.unidecode(string) #Clean up the text
-                string = string.replace('\n',' ').replace('\r',' ').strip() #Remove both types of newlines and any whitespace
-                pageSent.extend(sent_tokenize(string)) #Add the sentences in this string to the list of article sentences
-        if pageSent[-1][:6].lower() == 'posted': #If the final sentence is the posting information
-            pageSent = pageSent[:-1] #Remove the last sentence
+        stageTimes = {} #Seconds spent in each stage for this page
+        pageHTML = None #Raw HTML of the page, if it was retrieved from the server
+        if offline: #If the page should come from the token cache
+            startTime = stageStart('cache',profiles) #Time the token cache lookup
+            cached = readCache(num,None) #Cached version of the page, whatever post content it was made from
+            stageStop('cache',profiles,stageTimes,startTime) #Token cache lookup complete
+            if not cached: #If the cache file could not be used, and the server is not being contacted
+                print('Page ' + str(num) + ' cache is out of date, skipping') #Alert the user the page was not scanned
+                continue #Move on to the next page
+            bpTitle,bpDate,pageHash,pageSent,pageTokens,pageAnchors = cached #Skip retrieval, parsing and tokenization
+            cachedWindows = len(pageTokens) #Number of runs of sentences already in the cache file
+        else: #If the page should come from the server
+            startTime = stageStart('fetch',profiles) #Time the page retrieval
+            r = s.get(url_str) #Get page content, using persisting session
+            pageHTML = r.text #Raw HTML of the page
+            stageStop('fetch',profiles,stageTimes,startTime) #Page retrieval complete
+            startTime = stageStart('parse',profiles) #Time the page parsing
+            soup = BeautifulSoup(pageHTML, "html.parser") #Parse the page text using BeautifulSoup
+            bpTitle = unidecode.unidecode(soup.find_all('h3', class_="blogPostTitle")[0].string).strip() #Article title
+            bpDate = unidecode.unidecode(soup.find_all('h4', class_="blogPostDate")[0].string).strip() #Post data
+            pageAnchors = [[link.get('href'),link.text] for link in soup.find_all(href=is_dash_link)] #Address and text of each dashboard link on the page
+            postCells = soup.find_all('td', class_='ms-vb blogPost') #Page content table cells
+            pageHash = hashlib.sha256('\n'.join([bpTitle,bpDate] + [str(td) for td in postCells]).encode('utf8')).digest() #Hash of the post title, date and body only, as the rest of the page changes with every request
+            stageStop('parse',profiles,stageTimes,startTime) #Page parsing complete
+            startTime = stageStart('cache',profiles) #Time the token cache lookup
+            cached = readCache(num,pageHash) #Previously extracted page information, if the post hasn't changed
+            stageStop('cache',profiles,stageTimes,startTime) #Token cache lookup complete
+            if cached: #If the post was found in the token cache
+                pageSent,pageTokens = cached[3:5] #Skip tokenization
+                cachedWindows = len(pageTokens) #Number of runs of sentences already in the cache file
+            else: #If the post has to be tokenized
+                
+                
+                ###Clean up the page text
+                startTime = stageStart('sentences',profiles) #Time the sentence tokenization
+                pageSent = [] #List of sentences in the article
+                for td in postCells: #Page content table cell
+                    for string in td.stripped_strings: #Each string within the table cell, with whitespace removed
+                        string = unidecode.unidecode(string) #Clean up the text
+                        string = string.replace('\n',' ').replace('\r',' ').strip() #Remove both types of newlines and any whitespace
+                        pageSent.extend(sent_tokenize(string)) #Add the sentences in this string to the list of article sentences
+                if pageSent[-1][:6].lower() == 'posted': #If the final sentence is the posting information
+                    pageSent = pageSent[:-1] #Remove the last sentence
+                pageTokens = {} #Words of each run of sentences, filled in as concordances are built
+                cachedWindows = -1 #The post is not in the cache file yet
+                stageStop('sentences',profiles,stageTimes,startTime) #Sentence tokenization complete
         
         
         ###Process each dashboard link on the page
-        for link in soup.find_all(href=is_dash_link): #For each dashboard link on the page
-            if link.get('href') not in linkSkip and cleanUnicode(link.text).replace('\n','').replace('\r','').strip() not in ['',',']: #No empty, comma, or skipped links
+        for link in pageAnchors: #For each dashboard link on the page [address, text]
+            if link[0] not in linkSkip and cleanUnicode(link[1]).replace('\n','').replace('\r','').strip() not in ['',',']: #No empty, comma, or skipped links
+                linkPages.setdefault(link[0].replace('\n','').replace('\r',''),[]).append([num,url_str]) #Record the page, in case the link needs to be checked [line breaks removed, as in the link check cache file]
                 
                 
                 ###Check proper categorization
-                categoryEval = properCategory(link.get('href'),categories) #Retrieve categorization status of the link, along with any corrections
+                startTime = stageStart('category',profiles) #Time the categorization check
+                categoryEval = properCategory(link[0],categories) #Retrieve categorization status of the link, along with any corrections
                 if not categoryEval[0]: #If the link was not properly categorized
-                    errors.append({'Page Number': num, 'Link': url_str, 'Type': 'Link', 'Problem': link.get('href'), 'Correction': categoryEval[1]}) #Store in error list
+                    errors.append({'Page Number': num, 'Link': url_str, 'Type': 'Link', 'Problem': link[0], 'Correction': categoryEval[1]}) #Store in error list
+                stageStop('category',profiles,stageTimes,startTime) #Categorization check complete
                 
                 
                 ###Get search term
+                startTime = stageStart('searchTerm',profiles) #Time the search term extraction
                 success = True #Was the link able to be successfully extracted?
-                searchTerm = unidecode.unidecode(link.text) #Retrieve and clean up the link text
+                searchTerm = unidecode.unidecode(link[1]) #Retrieve and clean up the link text
                 searchTerm = searchTerm.replace('\n',' ').replace('\r',' ').strip() #Remove line breaks and whitespace
                 divSearch = re.search('V-[0-9][0-9][0-9]',searchTerm) #Searching for a 'V-###' pattern
                 divSearchMod = re.search('[0-9][0-9][0-9]',searchTerm) #Searching for a '###' pattern
@@ -227,12 +513,13 @@ if __name__ == '__main__':
                             if len(searchTerm) > 1: #If the string is longer than one character
                                 searchTerm = searchTerm[:-1] #Shorten the term by one character
                             else: #If the string is one or fewer characters long
-                                searchTerm = unidecode.unidecode(link.text).replace('\n','').replace('\r','').strip() #Retrieve original search term
+                                searchTerm = unidecode.unidecode(link[1]).replace('\n','').replace('\r','').strip() #Retrieve original search term
                                 errors.append({'Page Number': num, 'Link': url_str, 'Type': 'Search Term', 'Problem': searchTerm, 'Correction': ''}) #Store in error list
                                 success = False #Indicate the link was not successfully extracted
                                 break #The link is dissolved; exit the while loop
                 searchTerm = searchTerm.strip() #Remove any additional whitespace
                 searchTerm = re.sub(' +',' ',searchTerm) #Condense blocks of multiple spaces
+                stageStop('searchTerm',profiles,stageTimes,startTime) #Search term extraction complete
                 print('<' + searchTerm + '>') #Log the search term to the console, for the user
                 
                 
@@ -241,6 +528,7 @@ if __name__ == '__main__':
                     
                     
                     ###Get concordance
+                    startTime = stageStart('concordance',profiles) #Time the concordance extraction
                     concord = '' #String that will eventually become the surrounding summary text
                     for i in range(0,len(pageSent)): #For each of the sentences on the page
                         
@@ -250,7 +538,7 @@ if __name__ == '__main__':
                             concord = pageSent[i] #Initialize the concordance as the sentence the search term is in
                             j = 0 #Number of sentences ahead of the matching sentence, in the page text
                             k = 0 #Number of sentences behind the matching sentence, in the page text
-                            while len(word_tokenize(concord)) < concMin: #Until there are enough words in the concordance
+                            while len(windowTokens(pageSent,pageTokens,i-k,i+j)) < concMin: #Until there are enough words in the concordance
                                 if (i+j+1) < len(pageSent): #If the current sentence is not the last on the page
                                     j=j+1 #Move one sentence ahead in the page text
                                     concord = concord + ' ' + pageSent[i+j] #Add the next sentence to the concordance
@@ -259,7 +547,7 @@ if __name__ == '__main__':
                                     concord = pageSent[i-k] + ' ' + concord #Add the previous sentence to the concordance
                                 else: #Couldn't find any additional sentences to add
                                     break #Stop searching for additional sentences, and accept the current concordance
-                            concord_W = word_tokenize(concord) #Make a list of words to draw concordance from
+                            concord_W = windowTokens(pageSent,pageTokens,i-k,i+j) #Make a list of words to draw concordance from
                             
                             
                             ###Shorten the concordance to the appropriate length, if necessary
@@ -314,11 +602,59 @@ if __name__ == '__main__':
                         elif i == (len(pageSent)-1): #Did not find the search term in any sentence
                             errors.append({'Page Number': num, 'Link': url_str, 'Type': 'Concordance', 'Problem': searchTerm, 'Correction': ''}) #Store in list of errors
                     
+                    stageStop('concordance',profiles,stageTimes,startTime) #Concordance extraction complete
                     
                     ###Add all fields of interest to print string
                     str_print += str(categoryEval[2]) + '|' + str(categoryEval[3]) #Add category information to print string
                     str_print += '|"' + str(bpTitle) +'"|'+ str(bpDate) +'|'+ str(url_str) #Add post information to print string
                     str_print += '|"'+ str(concord) +'"\n' #Add concordance information to print string
+        
+        
+        ###Store the page, so it need not be tokenized again
+        if len(pageTokens) != cachedWindows: #If the page is new, or new runs of sentences were tokenized
+            startTime = stageStart('cache',profiles) #Time the token cache update
+            writeCache(num,pageHash,bpTitle,bpDate,pageSent,pageTokens,pageAnchors) #Write the page to the token cache
+            stageStop('cache',profiles,stageTimes,startTime) #Token cache update complete
+        
+        
+        ###Record page timings
+        pageTime = sum(stageTimes.values()) #Total seconds spent on this page
+        for stage in stageTimes: #For each stage the page went through
+            runTimes[stage] = runTimes.get(stage,0) + stageTimes[stage] #Add to the run totals
+        pageTimes.append([pageTime,num]) #Keep the page time, to find the slowest pages
+        if profiling and pageTime > slowPage: #If the page was slow to process
+            print('Page ' + str(num) + ' took ' + '%.2f' % pageTime + ' seconds, capturing...') #Alert the user of the slow page
+            captureSlowPage(num,pageHTML,stageTimes) #Save the page for offline replay
+    
+    
+    ###Verify dashboard links
+    if verifying: #If link checking was requested
+        linkCache = readLinkCache() #Results of previous link checks
+        checkTime = time.time() #Time of this round of checks
+        toCheck = [href for href in linkPages if href not in linkCache or checkTime - linkCache[href][1] > linkTTL] #Links never checked, or not checked recently
+        print('Verifying ' + str(len(toCheck)) + ' of ' + str(len(linkPages)) + ' unique dashboard links...') #Alert the user of the number of checks
+        with ThreadPoolExecutor(max_workers=linkWorkers) as pool: #Bounded pool of link checkers, shut down however the checks end
+            results = list(pool.map(lambda href: isLiveLink(href,username,password,linkTimeout),toCheck)) #Check the links concurrently
+        for href,alive in zip(toCheck,results): #Each checked link, in order
+            if alive is None: #If the link couldn't be checked
+                print('Could not check <' + href + '>') #Alert the user, and check again next run
+            elif alive == 'Missing': #If the page loaded, but without the project or staff name
+                print('Name not found on <' + href + '>') #Alert the user, and check again next run rather than caching
+                for page in linkPages[href]: #Each page the link appears on
+                    linkWarnings.append({'Page Number': page[0], 'Link': page[1], 'Type': 'Possible Dead Link', 'Problem': href, 'Correction': ''}) #Store in warning list
+            else: #If the link was checked
+                linkCache[href] = [alive,checkTime] #Store the result
+        writeLinkCache(linkCache,linkTTL) #Save the results for later runs
+        for href in linkPages: #Each unique dashboard link
+            if href in linkCache and not linkCache[href][0]: #If the linked page doesn't exist
+                for page in linkPages[href]: #Each page the link appears on
+                    errors.append({'Page Number': page[0], 'Link': page[1], 'Type': 'Dead Link', 'Problem': href, 'Correction': ''}) #Store in error list
+    
+    
+    ###Write profile
+    if profiling: #If profiling was requested
+        print('Writing profile...') #Notify the user the profile is being written
+        writeProfile(profiles,runTimes,pageTimes) #Write the aggregated profile for the run
     
     
     ###Write output files
@@ -334,6 +670,13 @@ if __name__ == '__main__':
                         break #Exit the loop, once the move is completed
                     except: #If the file is inaccesible (likely open)
                         placeholder = input('Please close historical error file. Press [Enter] when ready...') #Give the user time to close the error file, then advance
+            elif file == 'volpe_voice_link_warnings_historical.xlsx': #If there is an existing link warnings file
+                while True: #Loop until the warnings file has been successfully relocated
+                    try: #If the file is accessible
+                        shutil.move(os.path.join(sys.path[0],file),os.path.join(sys.path[0],'Old Error Logs','volpe_voice_link_warnings_historical_' + time.strftime('%Y%m%d_%H%M%S') + '.xlsx')) #Relocate the old warnings file
+                        break #Exit the loop, once the move is completed
+                    except: #If the file is inaccesible (likely open)
+                        placeholder = input('Please close historical link warnings file. Press [Enter] when ready...') #Give the user time to close the warnings file, then advance
             elif 'volpe_voice_dash_links_historical_' in file: #If this is a historical links file
                 while True: #Loop until the errors file has been successfully relocated
                     try: #If the file is accessible
@@ -353,4 +696,13 @@ if __name__ == '__main__':
         df = df[['Page Number','Link','Type','Problem','Correction']] #Re-order the columns
         writer = pd.ExcelWriter('volpe_voice_errors_historical.xlsx') #Name of the workbook to be written to
         df.to_excel(writer,sheet_name='Errors') #Sheet to write the dataframe to
+        writer.save() #Close the output workbook
+    
+    
+    ###Print link warnings file, which does not hold back the link file
+    if linkWarnings: #There were links that may be dead
+        df = pd.DataFrame(linkWarnings) #Put the warnings into a dataframe for exporting
+        df = df[['Page Number','Link','Type','Problem','Correction']] #Re-order the columns
+        writer = pd.ExcelWriter('volpe_voice_link_warnings_historical.xlsx') #Name of the workbook to be written to
+        df.to_excel(writer,sheet_name='Warnings') #Sheet to write the dataframe to
         writer.save() #Close the output workbook
\ No newline at end of file